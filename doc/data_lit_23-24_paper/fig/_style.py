@@ -0,0 +1,26 @@
+from functools import cache
+
+import matplotlib as mpl
+from tueplots import bundles, cycler
+from tueplots.constants import markers
+from tueplots.constants.color import palettes
+
+MUTED_CYCLER = cycler.cycler(color=palettes.paultol_muted, marker=markers.o_sized)
+LIGHT_CYCLER = cycler.cycler(color=palettes.paultol_light)
+
+
+@cache
+def icml2022(column: str, nrows: float, ncols: float) -> dict:
+    return bundles.icml2022(
+        family="Times New Roman", column=column, nrows=nrows, ncols=ncols, usetex=False
+    )
+
+
+def apply_style(
+    column: str = "half",
+    nrows: float = 1,
+    ncols: float = 1,
+    style_cycler: dict = MUTED_CYCLER,
+) -> None:
+    mpl.rcParams.update(icml2022(column, nrows, ncols))
+    mpl.rcParams.update(style_cycler)
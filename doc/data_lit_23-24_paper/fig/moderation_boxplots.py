@@ -1,23 +1,47 @@
 from pathlib import Path
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-from tueplots import bundles, cycler
-from tueplots.constants import markers
-from tueplots.constants.color import palettes, rgb
+from matplotlib.figure import Figure
+from tueplots.constants.color import rgb
 
-plt.rcParams.update(
-    bundles.icml2022(
-        family="Times New Roman", column="half", nrows=1, ncols=1, usetex=False
-    )
-)
-plt.rcParams.update(cycler.cycler(color=palettes.paultol_muted, marker=markers.o_sized))
+from _style import apply_style
+
+apply_style(column="half", nrows=1, ncols=1)
 custom_colors = [rgb.tue_darkblue, rgb.pn_red]
 
 PATH_FIG = Path(__file__).parent
 DATA_DIR = Path(__file__).parent.parent.parent.parent / "data"
 
 
+def get_box_stats(scores: pd.DataFrame, whis: float = 1.5) -> list[dict]:
+    """
+    Compute the boxplot statistics of each column with vectorized numpy calls.
+    """
+    values = scores.to_numpy()
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75], axis=0)
+    iqr = q3 - q1
+    lower, upper = q1 - whis * iqr, q3 + whis * iqr
+
+    stats = []
+    for i, label in enumerate(scores.columns):
+        col = values[:, i]
+        is_inlier = (col >= lower[i]) & (col <= upper[i])
+        stats.append(
+            dict(
+                label=label,
+                mean=col.mean(),
+                med=median[i],
+                q1=q1[i],
+                q3=q3[i],
+                whislo=col[is_inlier].min(),
+                whishi=col[is_inlier].max(),
+                fliers=col[~is_inlier],
+            )
+        )
+    return stats
+
+
 def main():
     score_cols = (
         "hate_score",
@@ -28,7 +52,7 @@ def main():
     )
     scores_titles = ("Hate", "Violence", "Sexual", "Harassment", "Self-Harm")
 
-    moderation = pd.read_csv(DATA_DIR / "csv" / "moderation.csv")
+    moderation = pd.read_csv(DATA_DIR / "csv" / "moderation.csv", engine="pyarrow")
     scores = moderation.loc[:, score_cols]
     scores = scores.rename(columns=dict(zip(score_cols, scores_titles)))
 
@@ -36,10 +60,10 @@ def main():
     median_values = scores.median().sort_values(ascending=False)
     scores = scores[median_values.index]
 
-    fig, ax = plt.subplots()
-    box = ax.boxplot(
-        scores,
-        labels=scores.columns,
+    fig = Figure(layout="constrained")
+    ax = fig.subplots()
+    box = ax.bxp(
+        get_box_stats(scores),
         showmeans=True,
         meanline=True,
         showfliers=True,
@@ -70,10 +94,7 @@ def main():
         median_line.set_linewidth(1)
 
     # Save the figure
-    plt.savefig(PATH_FIG / "moderation_boxplots.pdf")
-
-    # Show the plot
-    plt.show()
+    fig.savefig(PATH_FIG / "moderation_boxplots.pdf")
 
 
 if __name__ == "__main__":
@@ -1,19 +1,13 @@
 from pathlib import Path
 
 import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 import pandas as pd
-from tueplots import bundles, cycler
-from tueplots.constants import markers
-from tueplots.constants.color import palettes
+from matplotlib.figure import Figure
 
-plt.rcParams.update(
-    bundles.icml2022(
-        family="Times New Roman", column="full", nrows=0.5, ncols=1, usetex=False
-    )
-)
-plt.rcParams.update(cycler.cycler(color=palettes.paultol_muted, marker=markers.o_sized))
+from _style import apply_style
+
+apply_style(column="full", nrows=0.5, ncols=1)
 
 PATH_FIG = Path(__file__).parent
 DATA_DIR = Path(__file__).parent.parent.parent.parent / "data"
@@ -41,27 +35,26 @@ def main():
         "Self-harm",
     ]
 
-    df = pd.read_csv(DATA_DIR / "csv" / "output.csv")
-    df["month"] = pd.to_datetime(df["query_date"], format="%Y-%m-%d").dt.strftime(
-        "%Y-%m"
+    df = pd.read_csv(DATA_DIR / "csv" / "output.csv", engine="pyarrow")
+    df["month"] = (
+        df["query_date"].astype("datetime64[ns]").to_numpy().astype("datetime64[M]")
     )
-    df["month"] = pd.to_datetime(df["month"], format="%Y-%m")
+    monthly_flag_share = df.groupby("month")[flag_columns].mean()
 
-    fig, ax = plt.subplots()
+    fig = Figure(layout="constrained")
+    ax = fig.subplots()
 
-    monthly_flag_counts = pd.Series()
     for col in flag_columns:
-        monthly_flag_counts = df.groupby("month")[col].mean()
         ax.plot(
-            monthly_flag_counts.index.to_pydatetime(),
-            monthly_flag_counts,
+            monthly_flag_share.index.to_pydatetime(),
+            monthly_flag_share[col].to_numpy(),
             marker="o",
             markersize=2,
             linewidth=1,
             label=col,
         )
-    if not monthly_flag_counts.empty:
-        ax.set_xlim(min(monthly_flag_counts.index), max(monthly_flag_counts.index))
+    if not monthly_flag_share.empty:
+        ax.set_xlim(min(monthly_flag_share.index), max(monthly_flag_share.index))
 
     ax.set_title("Monthly Share of Flagged Songs", fontsize=9)
     ax.set_xlabel("")
@@ -87,8 +80,7 @@ def main():
 
     ax.legend(fontsize=9, labels=flag_names, loc="upper right", ncol=3)
 
-    plt.savefig(PATH_FIG / "monthly_share_flagged.pdf")
-    plt.show()
+    fig.savefig(PATH_FIG / "monthly_share_flagged.pdf")
 
 
 if __name__ == "__main__":
@@ -1,19 +1,16 @@
+import itertools
 import re
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import seaborn as sns
-from matplotlib import pyplot as plt
-from tueplots import bundles, cycler
-from tueplots.constants import markers
-from tueplots.constants.color import palettes, rgb
-
-plt.rcParams.update(
-    bundles.icml2022(
-        family="Times New Roman", column="full", nrows=1, ncols=2, usetex=False
-    )
-)
-plt.rcParams.update(cycler.cycler(color=palettes.paultol_muted, marker=markers.o_sized))
+from matplotlib.figure import Figure
+from tueplots.constants.color import rgb
+
+from _style import apply_style
+
+apply_style(column="full", nrows=1, ncols=2)
 
 PATH_FIG = Path(__file__).parent
 DATA_DIR = Path(__file__).parent.parent.parent.parent / "data"
@@ -22,11 +19,18 @@ SPLIT_PATTERN = re.compile(r"[,&]")
 
 
 def get_data():
-    df = pd.read_csv(DATA_DIR / "csv" / "output.csv")
-    df["album_artist_genius"] = df["album_artist_genius"].apply(
-        lambda x: [x.strip() for x in SPLIT_PATTERN.split(x)]
+    df = pd.read_csv(DATA_DIR / "csv" / "output.csv", engine="pyarrow")
+    artists = df["album_artist_genius"].str.split(SPLIT_PATTERN)
+    df = pd.DataFrame(
+        {
+            "album_artist_genius": [
+                artist.strip() for artist in itertools.chain.from_iterable(artists)
+            ],
+            "query_date": np.repeat(
+                df["query_date"].to_numpy(), artists.str.len().to_numpy()
+            ),
+        }
     )
-    df = df.explode("album_artist_genius")
     return (
         df.groupby("album_artist_genius")
         .query_date.nunique()
@@ -37,7 +41,8 @@ def get_data():
 def main():
     bins = list(range(10))
 
-    fig, ax = plt.subplots(1, 2)
+    fig = Figure(layout="constrained")
+    ax = fig.subplots(1, 2)
 
     df = get_data()
     sns.histplot(
@@ -79,8 +84,7 @@ def main():
         spine.set_linewidth(1)
         spine.set_color("black")
 
-    plt.savefig(PATH_FIG / "no_weeks_in_charts.pdf")
-    plt.show()
+    fig.savefig(PATH_FIG / "no_weeks_in_charts.pdf")
 
 
 if __name__ == "__main__":
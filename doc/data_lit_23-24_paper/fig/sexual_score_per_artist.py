@@ -1,21 +1,19 @@
+import re
 from pathlib import Path
 
 import pandas as pd
 import seaborn as sns
-from matplotlib import pyplot as plt
-from tueplots import bundles, cycler
-from tueplots.constants.color import palettes
+from matplotlib.figure import Figure
+
+from _style import LIGHT_CYCLER, apply_style
 
 DATA_DIR = Path(__file__).parent.parent.parent.parent / "data"
 FIG_DIR = Path(__file__).parent
 SELECTED_ARTISTS = ("Farid Bang", "SXTN", "Olexesh", "Kontra K")
+SPLIT_PATTERN = re.compile(r"[,&]")
+MAX_SCORES_PER_ARTIST = 5000
 
-plt.rcParams.update(
-    bundles.icml2022(
-        family="Times New Roman", column="half", nrows=1.0, ncols=1.0, usetex=False
-    )
-)
-plt.rcParams.update(cycler.cycler(color=palettes.paultol_light))
+apply_style(column="half", nrows=1.0, ncols=1.0, style_cycler=LIGHT_CYCLER)
 
 
 def artist_filter(x):
@@ -23,24 +21,34 @@ def artist_filter(x):
 
 
 def main():
-    moderation = pd.read_csv(DATA_DIR / "csv" / "moderation.csv")
-    songs = pd.read_csv(DATA_DIR / "csv" / "songs.csv")
+    moderation = pd.read_csv(DATA_DIR / "csv" / "moderation.csv", engine="pyarrow")
+    songs = pd.read_csv(DATA_DIR / "csv" / "songs.csv", engine="pyarrow")
     df = pd.merge(moderation, songs, on="song_id", how="inner")
 
-    df_selected = []
-    for artist in SELECTED_ARTISTS:
-        scores = df.loc[
-            df.album_artist_genius.apply(lambda x: artist in x)
-        ].sexual_score.values
-        df_selected.extend({"artist": artist, "score": score} for score in scores)
-    df_selected = pd.DataFrame(df_selected)
+    exploded = df.assign(artist=df["album_artist_genius"].str.split(SPLIT_PATTERN))
+    exploded = exploded.explode("artist")
+    exploded["artist"] = exploded["artist"].str.strip()
+    df_selected = exploded.loc[exploded["artist"].isin(SELECTED_ARTISTS)]
+    # the violin's kde gets expensive for large samples
+    sizes = df_selected.groupby("artist")["artist"].transform("size")
+    too_many = sizes > MAX_SCORES_PER_ARTIST
+    df_selected = pd.concat(
+        [
+            df_selected.loc[~too_many],
+            df_selected.loc[too_many]
+            .groupby("artist")
+            .sample(MAX_SCORES_PER_ARTIST, random_state=0),
+        ]
+    )
 
-    fig, ax = plt.subplots()
+    fig = Figure(layout="constrained")
+    ax = fig.subplots()
     sns.violinplot(
         data=df_selected,
         x="artist",
-        y="score",
+        y="sexual_score",
         hue="artist",
+        hue_order=SELECTED_ARTISTS,
         density_norm="width",
         order=SELECTED_ARTISTS,
         ax=ax,
@@ -60,8 +68,7 @@ def main():
         spine.set_linewidth(1)
         spine.set_color("black")
 
-    plt.savefig(FIG_DIR / "sexual_score_per_artist.pdf")
-    plt.show()
+    fig.savefig(FIG_DIR / "sexual_score_per_artist.pdf")
 
 
 if __name__ == "__main__":
@@ -2,9 +2,13 @@
 This script runs the scraping pipeline.
 """
 import asyncio
+from collections.abc import AsyncIterable, Iterable
 from datetime import date
+from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from moderation.service import ModerationService
 from scraping.chart_scraper import ChartScraper
@@ -23,37 +27,95 @@ def save_df(df: pd.DataFrame, name: str) -> None:
     # df.to_excel(CSV_DIR / f"{name}.xlsx", index=False)
 
 
+async def collect_to_parquet(
+    rows: AsyncIterable[dict] | Iterable[dict], path: Path, batch_size: int = 1000
+) -> pd.DataFrame:
+    """
+    Stream rows to a parquet file in batches and load the file as dataframe.
+    """
+    if not isinstance(rows, AsyncIterable):
+        rows = _to_async_iterable(rows)
+
+    writer, batch = None, []
+    try:
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer = _write_batch(batch, path, writer)
+                batch = []
+        if batch or writer is None:
+            writer = _write_batch(batch, path, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return pd.read_parquet(path)
+
+
+def _write_batch(
+    batch: list[dict], path: Path, writer: pq.ParquetWriter | None
+) -> pq.ParquetWriter:
+    """
+    Write a batch of rows, opening the writer with the schema of the first batch.
+    """
+    if writer is not None:
+        writer.write_table(pa.Table.from_pylist(batch, schema=writer.schema))
+        return writer
+
+    # columns without any value in the first batch are stored as float,
+    # which is also what pandas would infer for them
+    table = pa.Table.from_pylist(batch)
+    schema = pa.schema(
+        field.with_type(pa.float64()) if pa.types.is_null(field.type) else field
+        for field in table.schema
+    )
+    writer = pq.ParquetWriter(path, schema)
+    writer.write_table(table.cast(schema))
+    return writer
+
+
+async def _to_async_iterable(rows: Iterable[dict]) -> AsyncIterable[dict]:
+    """
+    Wrap a (blocking) iterable as async iterable.
+    """
+    for row in rows:
+        yield row
+
+
 async def main(min_date: date, max_date: date, overwrite: bool = False) -> None:
     """
     Run the complete scraping pipeline.
     """
     # 1. Scraping chart lists
     if (CSV_DIR / "charts.csv").exists() and not overwrite:
-        charts_df = pd.read_csv(CSV_DIR / "charts.csv")
+        charts_df = pd.read_csv(CSV_DIR / "charts.csv", engine="pyarrow")
     else:
         chart_scraper = ChartScraper(min_date=min_date, max_date=max_date)
-        chart_entries = [chart_entry async for chart_entry in chart_scraper.run()]
-        charts_df = pd.DataFrame(chart_entries)
+        charts_df = await collect_to_parquet(
+            chart_scraper.run(), CSV_DIR / "charts.parquet"
+        )
         save_df(charts_df, "charts")
 
     # 2. Scraping songs and lyrics
     if (CSV_DIR / "songs.csv").exists() and not overwrite:
-        songs_df = pd.read_csv(CSV_DIR / "songs.csv")
+        songs_df = pd.read_csv(CSV_DIR / "songs.csv", engine="pyarrow")
     else:
         album_ids = (
-            charts_df.groupby("album_id")[["album_title", "album_artist"]]
-            .first()
-            .reset_index()
+            charts_df.sort_values("query_date", kind="stable")[
+                ["album_id", "album_title", "album_artist"]
+            ]
+            .drop_duplicates(subset="album_id")
             .to_dict(orient="records")
         )
         album_genius_scraper = GeniusLyricsScraper(album_ids=album_ids)
-        genius_song_results = list(album_genius_scraper.run())
-        songs_df = pd.DataFrame(genius_song_results)
+        songs_df = await collect_to_parquet(
+            album_genius_scraper.run(), CSV_DIR / "songs.parquet"
+        )
         save_df(songs_df, "songs")
 
     # 3. Moderating lyrics
     if (CSV_DIR / "moderation.csv").exists() and not overwrite:
-        moderation_df = pd.read_csv(CSV_DIR / "moderation.csv")
+        moderation_df = pd.read_csv(CSV_DIR / "moderation.csv", engine="pyarrow")
     else:
         song_ids = songs_df.loc[
             songs_df["has_lyrics"]
@@ -63,8 +125,9 @@ async def main(min_date: date, max_date: date, overwrite: bool = False) -> None:
             "song_id",
         ]
         moderation_service = ModerationService(song_ids=set(song_ids))
-        moderation_results = [r async for r in moderation_service.run()]
-        moderation_df = pd.DataFrame(moderation_results)
+        moderation_df = await collect_to_parquet(
+            moderation_service.run(), CSV_DIR / "moderation.parquet"
+        )
         save_df(moderation_df, "moderation")
 
     # 4. Merging data
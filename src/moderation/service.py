@@ -3,19 +3,27 @@ Service for moderating lyrics.
 """
 import asyncio
 import hashlib
-import json
+import io
 import random
-from collections.abc import AsyncIterable
+import zipfile
+from collections.abc import AsyncIterable, Iterator
 from pathlib import Path
 from typing import TypedDict
 
+import aiofiles
+import httpx
+import numpy as np
 import openai
-from openai import AsyncOpenAI
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from tqdm.auto import tqdm
 
 from utils.config import DATA_DIR, SECRETS
 
 COLS = ["violence", "self_harm", "sexual", "harassment", "hate"]
+SAVE_INDEX_EVERY = 500
 
 
 class ModerationResult(TypedDict):
@@ -33,6 +41,9 @@ class ModerationResult(TypedDict):
     hate_flag: bool
 
 
+IndexEntry = tuple[int | None, ModerationResult]
+
+
 class ModerationService:
     """
     Service for moderating lyrics.
@@ -41,73 +52,175 @@ class ModerationService:
     def __init__(
         self,
         song_ids: set[str],
-        lyrics_dir: Path = DATA_DIR / "lyrics",
+        lyrics_zip: Path = DATA_DIR / "lyrics.zip",
         moderation_dir: Path = DATA_DIR / "moderation",
         encoding: str = "utf-8",
         chunk_size: int = 1000,
-        slide: int = 500,
+        overlap: int = 100,
         overwrite: bool = False,
         max_retries: int = 5,
         timeout: int = 30,
+        max_concurrency: int = 32,
         cols: list[str] | None = None,
         client: AsyncOpenAI | None = None,
     ):
-        moderation_dir.mkdir(exist_ok=True, parents=True)
-        if not lyrics_dir.exists():
-            raise ValueError(f"Lyrics directory {lyrics_dir} does not exist")
+        for i in range(256):
+            (moderation_dir / f"{i:02x}").mkdir(exist_ok=True, parents=True)
+        if not lyrics_zip.exists():
+            raise ValueError(f"Lyrics archive {lyrics_zip} does not exist")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError(f"Overlap {overlap} must be in [0, {chunk_size})")
 
         self.song_ids = song_ids
-        self.lyrics_dir = lyrics_dir
+        self.lyrics_zip = lyrics_zip
         self.moderation_dir = moderation_dir
         self.encoding = encoding
         self.chunk_size = chunk_size
-        self.slide = slide
+        self.overlap = overlap
         self.overwrite = overwrite
         self.max_retries = max_retries
         self.timeout = timeout
+        self.max_concurrency = max_concurrency
         self.cols = cols or COLS
-        self.client = client or AsyncOpenAI(api_key=SECRETS.OPENAI_API_KEY)
+        self.index_file = moderation_dir / f"_index_{chunk_size}_{overlap}.parquet"
+        self.client = client or AsyncOpenAI(
+            api_key=SECRETS.OPENAI_API_KEY,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_concurrency,
+                    max_keepalive_connections=max_concurrency,
+                )
+            ),
+        )
 
     async def run(self) -> AsyncIterable[ModerationResult]:
         """
-        Run the moderation pipeline.
+        Run the moderation pipeline, moderating up to `max_concurrency` songs at once.
+
+        Songs already moderated in a previous run are yielded from the index file, as
+        long as their lyrics have not changed since.
         """
-        for song_id in tqdm(self.song_ids, desc="Moderating songs"):
-            lyrics = self._load_lyrics(song_id)
-            moderations = await asyncio.gather(
-                *(self._create_moderation(chunk) for chunk in self._chunk_text(lyrics))
-            )
-            flagged = any(r["flagged"] for r in moderations)
-            category_scores = {
-                f"{c}_score": max(r["category_scores"][c] for r in moderations)
-                for c in self.cols
-            }
-            category_flags = {
-                f"{c}_flag": any(r["categories"][c] for r in moderations)
-                for c in self.cols
+        index = self._load_index()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        with zipfile.ZipFile(self.lyrics_zip) as archive:
+            lyrics_crcs = {
+                song_id: archive.getinfo(f"{song_id}.txt").CRC
+                for song_id in self.song_ids
             }
-            yield {
-                "song_id": song_id,
-                "flagged": flagged,
-                **category_scores,
-                **category_flags,
+            cached = {
+                song_id
+                for song_id in self.song_ids
+                if song_id in index and index[song_id][0] == lyrics_crcs[song_id]
             }
 
-    async def _create_moderation(self, text: str) -> dict:
+            async def _process_song(song_id: str) -> ModerationResult:
+                async with semaphore:
+                    return await self._moderate_song(song_id, archive)
+
+            tasks = [
+                asyncio.create_task(_process_song(song_id))
+                for song_id in self.song_ids
+                if song_id not in cached
+            ]
+            try:
+                for song_id in self.song_ids:
+                    if song_id in cached:
+                        yield index[song_id][1]
+
+                for i, future in enumerate(
+                    tqdm.as_completed(tasks, desc="Moderating songs"), start=1
+                ):
+                    result = await future
+                    song_id = result["song_id"]
+                    index[song_id] = (lyrics_crcs[song_id], result)
+                    if i % SAVE_INDEX_EVERY == 0:
+                        self._save_index(index)
+                    yield result
+            finally:
+                for task in tasks:
+                    task.cancel()
+                self._save_index(index)
+
+    def _load_index(self) -> dict[str, IndexEntry]:
         """
-        Create a moderation for a given text.
+        Load previous results with the CRC of their lyrics, keyed by song id.
         """
-        cache_hash = hashlib.md5(text.encode()).hexdigest()
-        cache_file = self.moderation_dir / f"{cache_hash}.json"
+        if not self.index_file.exists() or self.overwrite:
+            return {}
+
+        index = {}
+        for row in pq.read_table(self.index_file).to_pylist():
+            lyrics_crc = row.pop("lyrics_crc", None)
+            index[row["song_id"]] = (lyrics_crc, row)
+        return index
+
+    def _save_index(self, index: dict[str, IndexEntry]) -> None:
+        """
+        Save the results of this and previous runs.
+        """
+        if index:
+            rows = [
+                {**result, "lyrics_crc": lyrics_crc}
+                for lyrics_crc, result in index.values()
+            ]
+            pq.write_table(pa.Table.from_pylist(rows), self.index_file)
 
-        if cache_file.exists() and not self.overwrite:
-            return json.loads(cache_file.read_text(encoding=self.encoding))
+    async def _moderate_song(
+        self, song_id: str, archive: zipfile.ZipFile
+    ) -> ModerationResult:
+        """
+        Moderate the lyrics of a given song id.
+        """
+        lyrics = self._load_lyrics(song_id, archive)
+        moderations = await self._create_moderations(list(self._chunk_text(lyrics)))
+        scores = np.array(
+            [[r["category_scores"][c] for c in self.cols] for r in moderations],
+            dtype=np.float64,
+        )
+        flags = np.array(
+            [[r["categories"][c] for c in self.cols] for r in moderations],
+            dtype=bool,
+        )
+        flagged = any(r["flagged"] for r in moderations)
+        category_scores = dict(
+            zip((f"{c}_score" for c in self.cols), scores.max(axis=0).tolist())
+        )
+        category_flags = dict(
+            zip((f"{c}_flag" for c in self.cols), flags.any(axis=0).tolist())
+        )
+        return {
+            "song_id": song_id,
+            "flagged": flagged,
+            **category_scores,
+            **category_flags,
+        }
+
+    async def _create_moderations(self, texts: list[str]) -> list[dict]:
+        """
+        Create the moderations for the given texts with a single request.
+
+        Results are cached per text, so only the uncached texts are requested.
+        """
+        cache_files = [self._get_cache_file(text) for text in texts]
+        results = list(
+            await asyncio.gather(
+                *(
+                    self._load_cached_moderation(cache_file)
+                    for cache_file in cache_files
+                )
+            )
+        )
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
 
         n_retries = 0
         while True:
             try:
                 response = await self.client.moderations.create(
-                    input=text, timeout=self.timeout
+                    input=[texts[i] for i in missing], timeout=self.timeout
                 )
                 break
             except openai.OpenAIError as e:
@@ -117,24 +230,59 @@ class ModerationService:
                 n_retries += 1
                 await asyncio.sleep(2**n_retries + random.random())
 
-        result = response.results[0].model_dump(mode="json")
-        cache_file.write_text(json.dumps(result), encoding=self.encoding)
-        return result
+        for i, response_result in zip(missing, response.results):
+            results[i] = response_result.model_dump(mode="json")
 
-    def _load_lyrics(self, song_id: str) -> str:
+        await asyncio.gather(
+            *(self._save_moderation(cache_files[i], results[i]) for i in missing)
+        )
+        return results
+
+    def _get_cache_file(self, text: str) -> Path:
         """
-        Load the lyrics for a given song id.
+        Get the cache file for a given text, sharded by the first byte of its hash.
         """
-        return (self.lyrics_dir / f"{song_id}.txt").read_text(encoding=self.encoding)
+        cache_hash = hashlib.md5(text.encode()).hexdigest()
+        return self.moderation_dir / cache_hash[:2] / f"{cache_hash}.json"
 
-    def _chunk_text(self, text: str) -> list[str]:
+    async def _load_cached_moderation(self, cache_file: Path) -> dict | None:
+        """
+        Load a cached moderation, returning None if it is not cached.
         """
-        Chunk the text into smaller parts.
+        if self.overwrite:
+            return None
+
+        try:
+            async with aiofiles.open(cache_file, "rb") as f:
+                return orjson.loads(await f.read())
+        except FileNotFoundError:
+            return None
+
+    async def _save_moderation(self, cache_file: Path, result: dict) -> None:
+        """
+        Save a moderation to the cache.
+        """
+        async with aiofiles.open(cache_file, "wb") as f:
+            await f.write(orjson.dumps(result))
+
+    def _load_lyrics(self, song_id: str, archive: zipfile.ZipFile) -> str:
+        """
+        Load the lyrics for a given song id from the lyrics archive.
+        """
+        with io.TextIOWrapper(
+            archive.open(f"{song_id}.txt"), encoding=self.encoding
+        ) as f:
+            return f.read()
+
+    def _chunk_text(self, text: str) -> Iterator[str]:
+        """
+        Chunk the text into windows of `chunk_size` that overlap by `overlap` chars.
         """
         text = text.strip()
-        for i in range(0, len(text), self.slide):
-            if (i + self.chunk_size) < len(text):
-                yield text[i : i + self.chunk_size].strip()
-            else:
-                yield text[-self.chunk_size :].strip()
-                break
+        if len(text) <= self.chunk_size:
+            yield text
+            return
+
+        step = self.chunk_size - self.overlap
+        for i in range(0, len(text) - self.overlap, step):
+            yield text[i : i + self.chunk_size]
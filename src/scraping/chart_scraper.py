@@ -2,15 +2,18 @@
 Scraping pipeline for the official German charts.
 """
 import asyncio
+import html
 import re
 from collections.abc import AsyncIterable
 from datetime import date, datetime, timedelta
 from pathlib import Path
 from typing import NamedTuple, TypedDict
 
-import bs4
-from bs4 import BeautifulSoup
-from httpx import AsyncClient
+import aiofiles
+import pyarrow as pa
+import pyarrow.parquet as pq
+from httpx import AsyncClient, Limits, Timeout
+from selectolax.lexbor import LexborHTMLParser, LexborNode
 from tenacity import retry, stop_after_attempt, wait_exponential
 from tqdm.auto import tqdm
 
@@ -27,6 +30,12 @@ DETAILS_ID_PATTERN = re.compile(r"/hiphop-details-(\d+)$")
 IMAGE_URL_PATTERN = re.compile(r"url\('([^']+)'\)")
 IN_CHARTS_PATTERN = re.compile(r"In Charts: (\d+) W")
 PEAK_PATTERN = re.compile(r"Peak: (\d+)")
+ROW_FIELD_PATTERN = re.compile(
+    r'<span class="(this-week|last-week|info-artist|info-title|info-label|plus-data)">'
+    r"([^<]*)</span>"
+    r'|<span class="(cover-img)" style="([^"]*)"'
+    r'|<a class="(drill-down)" href="([^"]*)"'
+)
 
 
 class ChartEntry(TypedDict):
@@ -45,6 +54,17 @@ class ChartEntry(TypedDict):
     album_in_charts_weeks: int
 
 
+class RowFields(NamedTuple):
+    href: str
+    artist: str
+    title: str
+    label: str
+    this_week: str
+    last_week: str
+    cover_style: str
+    plus_data: list[str]
+
+
 class PlusData(NamedTuple):
     in_charts: int
     peak: int
@@ -61,6 +81,7 @@ class ChartScraper:
         max_date: date,
         encoding: str = "utf-8",
         sleep: float = 0.5,
+        max_concurrency: int = 8,
         overwrite: bool = False,
         base_url: str = BASE_URL,
         charts_url: str = CHARTS_URL,
@@ -71,21 +92,43 @@ class ChartScraper:
         self.max_date = max_date
         self.encoding = encoding
         self.sleep = sleep
+        self.max_concurrency = max_concurrency
         self.overwrite = overwrite
         self.base_url = base_url
         self.charts_url = charts_url
         self.html_dir = html_dir
-        self.client = client or AsyncClient()
+        self.client = client or AsyncClient(
+            http2=True,
+            limits=Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+            timeout=Timeout(30.0),
+        )
 
     async def run(self) -> AsyncIterable[ChartEntry]:
         """
-        Run the scraping pipeline.
+        Run the scraping pipeline, scraping up to `max_concurrency` dates at once.
+
+        Entries are yielded in date order, regardless of which date finishes first.
         """
-        time_ranges = list(self._get_time_ranges())
-        for query_date in tqdm(time_ranges, desc="Scraping charts"):
-            html = await self._scrape_query_date(query_date)
-            for entry in self._parse_html(query_date, html):
-                yield entry
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _scrape(query_date: date) -> list[ChartEntry]:
+            async with semaphore:
+                return await self._get_entries(query_date)
+
+        tasks = [
+            asyncio.create_task(_scrape(query_date))
+            for query_date in self._get_time_ranges()
+        ]
+        try:
+            for task in tqdm(tasks, desc="Scraping charts"):
+                for entry in await task:
+                    yield entry
+        finally:
+            for task in tasks:
+                task.cancel()
 
     def _get_time_ranges(self) -> list[datetime]:
         """
@@ -97,6 +140,21 @@ class ChartScraper:
             yield query_date
             query_date += timedelta(days=7)
 
+    async def _get_entries(self, query_date: date) -> list[ChartEntry]:
+        """
+        Get the chart entries for a given date, cached as parquet after parsing.
+        """
+        f_out = self.html_dir / f"{query_date}.parquet"
+
+        if f_out.exists() and not self.overwrite:
+            return pq.read_table(f_out).to_pylist()
+
+        html = await self._scrape_query_date(query_date)
+        entries = list(self._parse_html(query_date, html))
+        pq.write_table(pa.Table.from_pylist(entries), f_out)
+
+        return entries
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
     async def _scrape_query_date(self, query_date: date) -> str:
         """
@@ -105,7 +163,8 @@ class ChartScraper:
         f_out = self.html_dir / f"{query_date}.html"
 
         if f_out.exists() and not self.overwrite:
-            return f_out.read_text(encoding=self.encoding)
+            async with aiofiles.open(f_out, encoding=self.encoding) as f:
+                return await f.read()
 
         dt = datetime(query_date.year, query_date.month, query_date.day)
         timestamp = int(dt.timestamp()) * 1000  # converting to milliseconds!
@@ -117,7 +176,8 @@ class ChartScraper:
         response.raise_for_status()
 
         html_str = response.text
-        f_out.write_text(html_str, encoding=self.encoding)
+        async with aiofiles.open(f_out, "w", encoding=self.encoding) as f:
+            await f.write(html_str)
 
         if self.sleep > 0:
             # sleeping to avoid getting blocked by the server
@@ -129,30 +189,34 @@ class ChartScraper:
         """
         Parse the html for a given date.
         """
-        soup = BeautifulSoup(html_str, "lxml")
+        tree = LexborHTMLParser(html_str)
 
         # 1. extract date range
         date_min, date_max = (
-            datetime.strptime(date_str, "%d.%m.%Y").date()
-            for date_str in DATE_PATTERN.findall(soup.select_one("span.ch-header").text)
+            self._parse_date(date_str)
+            for date_str in DATE_PATTERN.findall(
+                tree.css_first("span.ch-header").text()
+            )
         )
 
         # 2. extract table
-        for row in soup.select_one("table.chart-table").select("tr"):
-            album_id = self._validate_id(row.select_one("a.drill-down")["href"])
+        for row in tree.css_first("table.chart-table").css("tr"):
+            fields = self._match_row(row.html) or self._select_row(row)
+
+            album_id = self._validate_id(fields.href)
             album_url = self.base_url.format(ID=album_id)
 
             artist, title, label = (
-                " ".join(row.select_one(f"span.info-{info}").text.split())
-                for info in ("artist", "title", "label")
+                " ".join(text.split())
+                for text in (fields.artist, fields.title, fields.label)
             )
 
-            pos_this_week = int(row.select_one("span.this-week").text.strip())
-            pos_last_week = row.select_one("span.last-week").text.strip()
+            pos_this_week = int(fields.this_week.strip())
+            pos_last_week = fields.last_week.strip()
             pos_last_week = int(pos_last_week) if pos_last_week else None
 
-            img_url = self._get_image_url(row.select_one("span.cover-img")["style"])
-            plus_data = self._extract_plus_data(row.select("span.plus-data"))
+            img_url = self._get_image_url(fields.cover_style)
+            plus_data = self._extract_plus_data(fields.plus_data)
 
             yield ChartEntry(
                 query_date=query_date,
@@ -170,6 +234,62 @@ class ChartScraper:
                 album_in_charts_weeks=plus_data.in_charts,
             )
 
+    @staticmethod
+    def _match_row(row_html: str) -> RowFields | None:
+        """
+        Extract the raw fields of a table row with a single regex pass.
+
+        Returns None if the row does not have the expected markup.
+        """
+        fields, plus_data = {}, []
+        for match in ROW_FIELD_PATTERN.finditer(row_html):
+            span_class, text, img_class, style, link_class, href = match.groups()
+            if span_class == "plus-data":
+                plus_data.append(html.unescape(text))
+            elif span_class:
+                fields.setdefault(span_class, html.unescape(text))
+            elif img_class:
+                fields.setdefault(img_class, html.unescape(style))
+            else:
+                fields.setdefault(link_class, html.unescape(href))
+
+        if len(fields) != 7 or len(plus_data) != 2:
+            return None
+
+        return RowFields(
+            href=fields["drill-down"],
+            artist=fields["info-artist"],
+            title=fields["info-title"],
+            label=fields["info-label"],
+            this_week=fields["this-week"],
+            last_week=fields["last-week"],
+            cover_style=fields["cover-img"],
+            plus_data=plus_data,
+        )
+
+    @staticmethod
+    def _select_row(row: LexborNode) -> RowFields:
+        """
+        Extract the raw fields of a table row with css selectors.
+        """
+        return RowFields(
+            href=row.css_first("a.drill-down").attributes["href"],
+            artist=row.css_first("span.info-artist").text(),
+            title=row.css_first("span.info-title").text(),
+            label=row.css_first("span.info-label").text(),
+            this_week=row.css_first("span.this-week").text(),
+            last_week=row.css_first("span.last-week").text(),
+            cover_style=row.css_first("span.cover-img").attributes["style"],
+            plus_data=[span.text() for span in row.css("span.plus-data")],
+        )
+
+    @staticmethod
+    def _parse_date(date_str: str) -> date:
+        """
+        Parse a date in the format dd.mm.yyyy.
+        """
+        return date(int(date_str[6:10]), int(date_str[3:5]), int(date_str[:2]))
+
     @staticmethod
     def _validate_id(album_id: str) -> str:
         """
@@ -189,11 +309,11 @@ class ChartScraper:
         return match.group(1) if match else ""
 
     @staticmethod
-    def _extract_plus_data(plus_data: bs4.element.Tag) -> PlusData:
+    def _extract_plus_data(plus_data: list[str]) -> PlusData:
         """
         Extract the plus data.
         """
-        in_charts_str, peak_str = (" ".join(span.text.split()) for span in plus_data)
+        in_charts_str, peak_str = (" ".join(text.split()) for text in plus_data)
 
         in_charts_match = IN_CHARTS_PATTERN.match(in_charts_str)
         peak_match = PEAK_PATTERN.match(peak_str)
@@ -1,38 +1,81 @@
 """
 Scrape the songs and lyrics from Genius.
 """
-import json
+import multiprocessing
+import os
 import re
-import shutil
-from hashlib import md5
+import sqlite3
+import string
+import threading
+import time
+import zipfile
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from functools import lru_cache
+from hashlib import blake2b
 from pathlib import Path
 from typing import TypedDict
 
-from jaro import jaro_winkler_metric
-from langdetect import detect, DetectorFactory, LangDetectException
+import orjson
+from anyascii import anyascii
+from langdetect import DetectorFactory, LangDetectException, PROFILES_DIRECTORY
 from lyricsgenius import Genius
-from tenacity import retry, stop_after_attempt, wait_exponential
+from rapidfuzz.distance import JaroWinkler
 from tqdm.auto import tqdm
-from unidecode import unidecode
 
 from utils.config import DATA_DIR, SECRETS
 
 DetectorFactory.seed = 0
+DETECTOR_FACTORY = DetectorFactory()
+DETECTOR_FACTORY.load_profile(PROFILES_DIRECTORY)
 
 GENIUS_DIR = DATA_DIR / "genius"
-LYRICS_DIR = DATA_DIR / "lyrics"
+LYRICS_ZIP = DATA_DIR / "lyrics.zip"
 LANG_DIR = DATA_DIR / "lang"
 GENIUS_DIR.mkdir(exist_ok=True, parents=True)
-LYRICS_DIR.mkdir(exist_ok=True, parents=True)
 LANG_DIR.mkdir(exist_ok=True, parents=True)
 
-REPLACE_PATTERN = re.compile(r",,")
-RM_PATTERN_1 = re.compile(r"\d*Embed$")
-RM_PATTERN_2 = re.compile(r"Folg RapGeniusDeutschland!$")
-RM_PATTERN_3 = re.compile(r"You might also like$")
+EMBED_SUFFIX = "Embed"
+FOLLOW_SUFFIX = "Folg RapGeniusDeutschland!"
+RECOMMENDATION_SUFFIX = "You might also like"
 VERSE_SPLIT_PATTERN = re.compile(r"\[.*?]")
 NEWLINE_PATTERN = re.compile(r"\n+")
+NON_ASCII_PATTERN = re.compile(r"[^\x00-\x7f]+")
 NON_ALPHANUM_PATTERN = re.compile(r"[^a-zA-Z0-9\s]+")
+MAX_TOKEN_CHARS = 200
+MIN_LANGUAGE_CHARS = 20
+
+
+def _detect_language(text: str) -> str:
+    """
+    Detect the language of the given text.
+
+    Texts too short to classify and single lines with a run of 200+ non-space chars
+    are marked as unknown up front, as langdetect is very slow on text without spaces.
+    """
+    if len(text) < MIN_LANGUAGE_CHARS:
+        return "unknown"
+    if "\n" not in text and max(map(len, text.split()), default=0) >= MAX_TOKEN_CHARS:
+        return "unknown"
+
+    try:
+        detector = DETECTOR_FACTORY.create()
+        detector.append(text)
+        return detector.detect()
+    except LangDetectException:
+        return "unknown"
+
+
+@lru_cache(maxsize=4096)
+def _normalize_name(name: str) -> str:
+    """
+    Normalize an artist name or album title for comparison.
+    """
+    return " ".join(NON_ALPHANUM_PATTERN.sub("", name.lower()).split())
 
 
 class AlbumID(TypedDict):
@@ -70,50 +113,124 @@ class GeniusLyricsScraper:
         overwrite: bool = False,
         encoding: str = "utf-8",
         genius_dir: Path = GENIUS_DIR,
-        lyrics_dir: Path = LYRICS_DIR,
+        lyrics_zip: Path = LYRICS_ZIP,
         lang_dir: Path = LANG_DIR,
+        max_retries: int = 2,
+        max_concurrency: int = 8,
     ):
         self.album_ids = album_ids
         self.overwrite = overwrite
         self.encoding = encoding
         self.genius_dir = genius_dir
-        self.lyrics_dir = lyrics_dir
+        self.db = sqlite3.connect(genius_dir / "albums.sqlite", check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS albums (album_id TEXT PRIMARY KEY, album BLOB)"
+        )
+        self.lyrics_zip = lyrics_zip
         self.lang_dir = lang_dir
+        self.languages: dict[str, str] = {}
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
         self.genius = Genius(access_token=SECRETS.GENIUS_TOKEN)
 
     def run(self) -> list[GeniusSong]:
         """
-        Run the scraping pipeline.
-        """
-        for album_id in tqdm(self.album_ids, desc="Scraping lyrics"):
-            for song in self._scrape_album(
-                album_id=album_id["album_id"],
-                title=album_id["album_title"],
-                artist=album_id["album_artist"],
-            ):
-                yield song
+        Run the scraping pipeline, scraping up to `max_concurrency` albums at once.
 
-        base_name = str(self.lyrics_dir.absolute().resolve())
-        shutil.make_archive(base_name, "zip", self.lyrics_dir)
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
-    def _scrape_album(self, album_id: str, title: str, artist: str) -> list[GeniusSong]:
+        The lyrics are written to a temporary archive that only replaces the existing
+        one once all albums have been scraped.
+        """
+        tmp_zip = self.lyrics_zip.with_name(f"{self.lyrics_zip.name}.tmp")
+        with (
+            zipfile.ZipFile(tmp_zip, "w", zipfile.ZIP_DEFLATED) as archive,
+            ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn")
+            ) as executor,
+            ThreadPoolExecutor(max_workers=self.max_concurrency) as threads,
+        ):
+            futures = [
+                threads.submit(
+                    self._scrape_album,
+                    album_id=album_id["album_id"],
+                    title=album_id["album_title"],
+                    artist=album_id["album_artist"],
+                    executor=executor,
+                    archive=archive,
+                )
+                for album_id in self.album_ids
+            ]
+            try:
+                for future in tqdm(
+                    as_completed(futures), total=len(futures), desc="Scraping lyrics"
+                ):
+                    yield from future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        os.replace(tmp_zip, self.lyrics_zip)
+
+    def _scrape_album(
+        self,
+        album_id: str,
+        title: str,
+        artist: str,
+        executor: Executor,
+        archive: zipfile.ZipFile,
+    ) -> list[GeniusSong]:
         """
         Scrape the songs and lyrics for a given album.
         """
-        f_out = self.genius_dir / f"{album_id}.json"
+        album = self._load_album(album_id, title, artist)
+        return list(
+            self._extract_songs(album_id, artist, title, album, executor, archive)
+        )
 
-        if f_out.exists() and not self.overwrite:
-            album = json.loads(f_out.read_text(encoding=self.encoding))
-        else:
-            album = self.genius.search_album(name=title, artist=artist)
-            album = album.to_dict() if album is not None else {}
-            f_out.write_text(json.dumps(album, indent=2), encoding=self.encoding)
+    def _load_album(self, album_id: str, title: str, artist: str) -> dict:
+        """
+        Load the album search result from the cache or search it on Genius.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT album FROM albums WHERE album_id = ?", (album_id,)
+            ).fetchone()
+
+        if row is not None and not self.overwrite:
+            return orjson.loads(row[0])
+
+        album = self._fetch_album_dict(title, artist)
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO albums VALUES (?, ?)",
+                (album_id, orjson.dumps(album)),
+            )
+        return album
 
-        return list(self._extract_songs(album_id, artist, title, album))
+    def _fetch_album_dict(self, title: str, artist: str) -> dict:
+        """
+        Search an album on Genius, retrying on failure.
+        """
+        n_retries = 0
+        while True:
+            try:
+                album = self.genius.search_album(name=title, artist=artist)
+                return album.to_dict() if album is not None else {}
+            except Exception as e:
+                if n_retries >= self.max_retries:
+                    raise e
+
+                time.sleep(min(2**n_retries, 10))
+                n_retries += 1
 
     def _extract_songs(
-        self, album_id: str, artist: str, title: str, album: dict
+        self,
+        album_id: str,
+        artist: str,
+        title: str,
+        album: dict,
+        executor: Executor,
+        archive: zipfile.ZipFile,
     ) -> list[GeniusSong]:
         """
         Extract the songs and lyrics from the album search result.
@@ -130,20 +247,33 @@ class GeniusLyricsScraper:
         title_sim = self._calc_similarity(title, album_title_genius)
         similarity = min(artist_sim, title_sim)
 
-        for track in album.get("tracks", []):
-            if (song_position := track["number"]) is None:
-                continue
-            if track["song"]["instrumental"]:
-                continue
+        tracks = [
+            track
+            for track in album.get("tracks", [])
+            if track["number"] is not None and not track["song"]["instrumental"]
+        ]
+        tracks_lyrics = list(
+            executor.map(
+                self._preprocess_text,
+                [track["song"]["lyrics"] for track in tracks],
+                chunksize=8,
+            )
+        )
+        languages = iter(
+            self._detect_languages(
+                [lyrics for lyrics in tracks_lyrics if lyrics], executor
+            )
+        )
 
+        for track, lyrics in zip(tracks, tracks_lyrics):
+            song_position = track["number"]
             song_id = track["song"]["id"]
             song_title = track["song"]["title"]
             song_artist = track["song"]["artist"]
 
-            if lyrics := self._preprocess_text(track["song"]["lyrics"]):
-                f_out = self.lyrics_dir / f"{song_id}.txt"
-                f_out.write_text(lyrics, encoding=self.encoding)
-                language = self._detect_language(lyrics)
+            if lyrics:
+                self._write_lyrics(archive, song_id, lyrics)
+                language = next(languages)
             else:
                 language = ""
 
@@ -163,49 +293,74 @@ class GeniusLyricsScraper:
                 similarity=similarity,
             )
 
-    def _detect_language(self, text: str) -> str:
+    def _write_lyrics(
+        self, archive: zipfile.ZipFile, song_id: str, lyrics: str
+    ) -> None:
+        """
+        Write the lyrics of a song to the archive, unless they are already in it.
         """
-        Detect the language of the given text.
+        name = f"{song_id}.txt"
+        with self.lock:
+            try:
+                archive.getinfo(name)
+            except KeyError:
+                archive.writestr(name, lyrics.encode(self.encoding))
+
+    def _detect_languages(self, texts: list[str], executor: Executor) -> list[str]:
         """
-        text_hash = md5(text.encode("utf-8")).hexdigest()
-        f_out = self.lang_dir / f"{text_hash}.txt"
+        Detect the languages of the given texts, running uncached texts in parallel.
 
-        if f_out.exists():
-            return f_out.read_text(encoding=self.encoding)
+        Languages are looked up by text hash, first in memory, then on disk, so that
+        identical lyrics are only detected once.
+        """
+        text_hashes = [
+            blake2b(text.encode("utf-8"), digest_size=16).hexdigest() for text in texts
+        ]
 
-        try:
-            language = detect(text)
-        except LangDetectException:
-            language = "unknown"
+        missing = {}
+        for text, text_hash in zip(texts, text_hashes):
+            if text_hash in self.languages or text_hash in missing:
+                continue
+            f_in = self.lang_dir / f"{text_hash}.txt"
+            try:
+                self.languages[text_hash] = f_in.read_text(encoding=self.encoding)
+            except FileNotFoundError:
+                missing[text_hash] = text
 
-        f_out.write_text(language, encoding=self.encoding)
-        return language
+        detected = executor.map(_detect_language, missing.values())
+        for text_hash, language in zip(missing, detected):
+            f_out = self.lang_dir / f"{text_hash}.txt"
+            f_out.write_text(language, encoding=self.encoding)
+            self.languages[text_hash] = language
+
+        return [self.languages[text_hash] for text_hash in text_hashes]
 
     @staticmethod
     def _preprocess_text(lyrics: str) -> str:
         """
         Preprocess the lyrics text.
         """
-        lyrics = unidecode(
-            lyrics.encode("utf-8").decode("utf-8"),
-            errors="ignore",
+        lyrics = NON_ASCII_PATTERN.sub(lambda m: anyascii(m.group()), lyrics)
+        lyrics = lyrics.strip().replace(",,", '"')
+        if lyrics.endswith(EMBED_SUFFIX):
+            lyrics = lyrics.removesuffix(EMBED_SUFFIX).rstrip(string.digits)
+        lyrics = lyrics.strip().removesuffix(FOLLOW_SUFFIX)
+
+        verses = (
+            NEWLINE_PATTERN.sub("\n", verse)
+            .strip()
+            .removesuffix(RECOMMENDATION_SUFFIX)
+            .strip()
+            for verse in VERSE_SPLIT_PATTERN.split(lyrics)[1:]
         )
-        lyrics = REPLACE_PATTERN.sub('"', lyrics.strip())
-        lyrics = RM_PATTERN_1.sub("", lyrics.strip())
-        lyrics = RM_PATTERN_2.sub("", lyrics.strip())
-
-        verses = VERSE_SPLIT_PATTERN.split(lyrics)[1:]
-        verses = [NEWLINE_PATTERN.sub("\n", verse).strip() for verse in verses]
-        verses = [RM_PATTERN_3.sub("", verse).strip() for verse in verses]
 
-        return "\n\n".join(v for v in verses if v)
+        return "\n\n".join(filter(None, verses))
 
     @staticmethod
     def _calc_similarity(string_1: str, string_2) -> float:
         """
         Calculate the similarity between two strings.
         """
-        string1 = " ".join(NON_ALPHANUM_PATTERN.sub("", string_1.lower()).split())
-        string2 = " ".join(NON_ALPHANUM_PATTERN.sub("", string_2.lower()).split())
-
-        return jaro_winkler_metric(string1, string2)
+        return JaroWinkler.similarity(
+            _normalize_name(string_1), _normalize_name(string_2)
+        )